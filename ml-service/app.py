@@ -5,12 +5,12 @@ Python ML Service con TensorFlow para predicciones financieras
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import numpy as np
-import pandas as pd
 from datetime import datetime, timedelta
-import tensorflow as tf
-from tensorflow import keras
-from sklearn.preprocessing import StandardScaler
-import pickle
+from functools import lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Queue, Empty
+import threading
+import time
 import os
 
 app = Flask(__name__)
@@ -18,29 +18,310 @@ CORS(app)
 
 # Configuración
 MODEL_PATH = 'models/finance_predictor.h5'
-SCALER_PATH = 'models/scaler.pkl'
+WEIGHTS_PATH = 'models/finance_weights.npy'
+SCALER_PATH = 'models/scaler.npz'
+TFLITE_PATH = 'models/finance_predictor_b{batch}.tflite'
+# mixed_float16 solo compensa con float16 nativo (AVX512-FP16, AMX, GPU);
+# en CPUs x86 comunes es más lento, así que se activa explícitamente
+DTYPE_POLICY = 'mixed_float16' if os.environ.get('MIXED_PRECISION') == '1' else 'float32'
+# os.cpu_count() ve las CPUs del host dentro de un contenedor: por defecto
+# tantos intérpretes como hilos de gunicorn (gunicorn_conf.threads)
+INTERPRETER_POOL_SIZE = int(os.environ.get('INTERPRETER_POOL_SIZE', 4))
+BATCH_MAX_SIZE = 32
+# Tamaños de lote con los que se convierte y compila el modelo: un lote se
+# rellena hasta el menor que lo contenga (una petición sola corre con 1)
+BATCH_BUCKETS = (1, 8, BATCH_MAX_SIZE)
+BATCH_MAX_WAIT = 0.005  # segundos
+MAX_PREDICTION_DAYS = 365
+DAYS_BUCKET = 30
+
+TRANSACTION_FIELDS = ('date', 'amount', 'type', 'category')
+CACHE_SIZE = 32
+
+# Niveles de riesgo según la razón gastos previstos / ingresos
+RISK_THRESHOLDS = (0.7, 0.9)
+RISK_LEVELS = ('bajo', 'medio', 'alto')
+
+# Dependencias pesadas: se importan en el primer uso para que el
+# servicio (y /health) arranque sin esperar a TensorFlow
+@lru_cache(maxsize=None)
+def _tf():
+    """Importar TensorFlow bajo demanda"""
+    import tensorflow as tf
+    return tf
+
+@lru_cache(maxsize=None)
+def _pd():
+    """Importar pandas bajo demanda"""
+    import pandas as pd
+    return pd
+
+@lru_cache(maxsize=None)
+def _standard_scaler():
+    """Importar StandardScaler bajo demanda"""
+    from sklearn.preprocessing import StandardScaler
+    return StandardScaler
+
+def transactions_key(transactions):
+    """Clave hashable de un payload en columnas, una tupla por campo"""
+    return tuple(
+        tuple(t.get(field) for t in transactions)
+        for field in TRANSACTION_FIELDS
+    )
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _transactions_frame(key):
+    """DataFrame de un payload, compartido por todos los cálculos"""
+    pd = _pd()
+    return pd.DataFrame(dict(zip(TRANSACTION_FIELDS, key)))
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _prepare_data(key):
+    """Agregación diaria de un payload (cacheada)"""
+    pd = _pd()
+    
+    # Copia con fechas parseadas; el DataFrame base se comparte.
+    # Las fechas llegan en ISO 8601 desde la API: parser en C, sin dateutil
+    df = _transactions_frame(key)
+    df = df.assign(date=pd.to_datetime(df['date'], format='ISO8601', cache=True, utc=True))
+    df = df.sort_values('date')
+    
+    dates = df['date'].to_numpy(dtype='datetime64[ns]')
+    amounts = df['amount'].to_numpy(dtype=np.float64)
+    
+    # Igual que groupby: se descartan fechas nulas
+    has_date = ~np.isnat(dates)
+    dates, amounts = dates[has_date], amounts[has_date]
+    
+    # Agregar por día (UTC) con claves enteras (días desde epoch)
+    day_key = dates.astype('datetime64[D]').view('int64')
+    codes, days = pd.factorize(day_key)
+    
+    # Igual que sum/count/mean de pandas: los montos nulos no cuentan
+    has_amount = ~np.isnan(amounts)
+    totals = np.bincount(codes[has_amount], weights=amounts[has_amount], minlength=len(days))
+    counts = np.bincount(codes[has_amount], minlength=len(days))
+    averages = np.divide(totals, counts, out=np.full_like(totals, np.nan), where=counts > 0)
+    
+    daily_data = pd.DataFrame({
+        'date': days.view('datetime64[D]'),
+        'total_amount': totals,
+        'transaction_count': counts,
+        'avg_amount': averages
+    })
+    
+    return df, daily_data
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _column_arrays(key):
+    """Columnas del payload como arrays de NumPy, sin pasar por pandas"""
+    columns = dict(zip(TRANSACTION_FIELDS, key))
+    amounts = np.asarray(columns['amount'], dtype=np.float64)
+    types = np.asarray(columns['type'], dtype=object)
+    categories = np.asarray(columns['category'], dtype=object)
+    return amounts, types, categories
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _historical_totals(key):
+    """Totales históricos de gastos e ingresos (cacheados)"""
+    amounts, types, _ = _column_arrays(key)
+    
+    # nansum: como sum() de pandas, los montos nulos no cuentan
+    total_expenses = abs(np.nansum(amounts[types == 'expense']))
+    total_income = np.nansum(amounts[types == 'income'])
+    return total_expenses, total_income
+
+def _financial_summary(total_expenses, total_income, predicted_expenses, transaction_count):
+    """Balance, riesgo y meta de ahorro a partir de los totales"""
+    current_balance = total_income - total_expenses
+    
+    # Calcular nivel de riesgo (umbrales exclusivos: > 0.7 medio, > 0.9 alto)
+    expense_ratio = predicted_expenses / total_income if total_income > 0 else 1
+    risk_level = RISK_LEVELS[int(np.searchsorted(RISK_THRESHOLDS, expense_ratio))]
+    
+    # Balance proyectado
+    avg_monthly_income = total_income / max(1, transaction_count // 30)
+    predicted_balance = current_balance + avg_monthly_income - predicted_expenses
+    
+    # Meta de ahorro sugerida
+    savings_goal = max(500, avg_monthly_income * 0.2)
+    
+    return {
+        'current_balance': current_balance,
+        'expense_ratio': expense_ratio,
+        'risk_level': risk_level,
+        'avg_monthly_income': avg_monthly_income,
+        'predicted_balance': predicted_balance,
+        'savings_goal': savings_goal
+    }
+
+def _mean_abs_expense(amounts, is_expense):
+    """Promedio absoluto de los gastos, ignorando montos nulos"""
+    total = 0.0
+    count = 0
+    for i in range(amounts.size):
+        if is_expense[i] and not np.isnan(amounts[i]):
+            total += amounts[i]
+            count += 1
+    return abs(total / count) if count else 0.0
+
+@lru_cache(maxsize=None)
+def _compiled_mean_abs_expense():
+    """Versión de _mean_abs_expense compilada con Numba"""
+    # Con firma explícita se compila aquí y no en la primera llamada;
+    # se invoca al arrancar cada worker para no cargarlo a una petición
+    from numba import njit
+    return njit('float64(float64[:], boolean[:])', cache=True)(_mean_abs_expense)
+
+def _batch_bucket(size):
+    """Menor tamaño de BATCH_BUCKETS que contiene un lote de size secuencias"""
+    return BATCH_BUCKETS[int(np.searchsorted(BATCH_BUCKETS, size))]
+
+def _pad_batch(sequences, size):
+    """Completar un lote con ceros hasta el tamaño fijo del modelo"""
+    padded = np.zeros((size,) + sequences.shape[1:], dtype=np.float32)
+    padded[:len(sequences)] = sequences
+    return padded
+
+def _rollout(model, sequence, days):
+    """Predicción autoregresiva de N días en una sola ejecución del grafo"""
+    tf = _tf()
+    
+    def step(window, _):
+        pred = model(window, training=False)
+        # La predicción ocupa todas las features del nuevo día
+        next_day = tf.broadcast_to(pred[:, None, :], tf.shape(window[:, -1:, :]))
+        return tf.concat([window[:, 1:, :], next_day], axis=1)
+    
+    windows = tf.scan(step, tf.range(days), initializer=sequence)
+    return windows[:, :, -1, :]
+
+@lru_cache(maxsize=None)
+def _compiled_rollout():
+    """Versión de _rollout compilada con XLA"""
+    return _tf().function(_rollout, jit_compile=True)
+
+class RolloutBatcher:
+    """Agrupa rollouts de peticiones concurrentes en una sola llamada al modelo"""
+    def __init__(self, run_batch, workers=1, max_batch=BATCH_MAX_SIZE, max_wait=BATCH_MAX_WAIT):
+        self.run_batch = run_batch
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = Queue()
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pid = None
+        
+    def submit(self, state, sequence, days):
+        """Encolar un rollout de forma (1, 7, 3) y esperar sus N días"""
+        self._ensure_started()
+        future = Future()
+        self._pending.put((state, sequence, days, future))
+        return future.result()
+    
+    def _ensure_started(self):
+        """Arrancar colector y ejecutores en el proceso actual (no sobreviven a un fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+                threading.Thread(target=self._collect, daemon=True).start()
+                self._pid = os.getpid()
+    
+    def _next_batch(self):
+        """Esperar una petición y juntar las que lleguen hasta max_wait"""
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.max_wait
+        
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=timeout))
+            except Empty:
+                break
+        
+        return batch
+    
+    def _collect(self):
+        """Único hilo colector: agrupa por modelo y horizonte y despacha a los ejecutores"""
+        while True:
+            groups = {}
+            for item in self._next_batch():
+                state, _, days, _ = item
+                groups.setdefault((state, days), []).append(item)
+            
+            for (state, days), group in groups.items():
+                self._executor.submit(self._run, state, group, days)
+    
+    def _run(self, state, group, days):
+        """Predecir un lote con el mismo modelo y horizonte y repartir los resultados"""
+        try:
+            sequences = np.concatenate([sequence for _, sequence, _, _ in group])
+            predictions = self.run_batch(state, sequences, days)
+        except Exception as e:
+            if len(group) == 1:
+                group[0][3].set_exception(e)
+                return
+            # Reintentar de a una para que un fallo no arrastre al lote
+            for item in group:
+                self._run(state, [item], days)
+            return
+        
+        for i, (_, _, _, future) in enumerate(group):
+            future.set_result(predictions[:, i])
+
+class ModelState:
+    """Modelo entrenado con su normalización y sus intérpretes TFLite"""
+    # Se reemplaza completo tras entrenar o cargar, para que una petición
+    # nunca combine el escalado de un modelo con los pesos de otro.
+    # interpreters: {tamaño de lote de BATCH_BUCKETS: pool de intérpretes}
+    def __init__(self, model, mean, scale, interpreters=None):
+        self.model = model
+        self.mean = mean
+        self.scale = scale
+        self.interpreters = interpreters
+    
+    def transform(self, x):
+        """Normalizar features con la media y escala del entrenamiento"""
+        return (x - self.mean) / self.scale
+    
+    def inverse(self, x):
+        """Revertir la normalización de features"""
+        return x * self.scale + self.mean
 
 class FinancePredictorModel:
     def __init__(self):
-        self.model = None
-        self.scaler = StandardScaler()
-        self.is_trained = False
+        self.state = None
+        self._train_lock = threading.Lock()
+        self.batcher = RolloutBatcher(self._rollout_batch, workers=INTERPRETER_POOL_SIZE)
+    
+    @property
+    def is_trained(self):
+        """Hay un modelo listo para servir predicciones"""
+        return self.state is not None
         
-    def build_model(self, input_shape):
+    def build_model(self, input_shape, dtype_policy='float32'):
         """Construir red neuronal LSTM para predicción de series temporales"""
+        keras = _tf().keras
+        # La salida (y con ella la pérdida) se mantiene siempre en float32
         model = keras.Sequential([
-            keras.layers.LSTM(64, return_sequences=True, input_shape=input_shape),
-            keras.layers.Dropout(0.2),
-            keras.layers.LSTM(32, return_sequences=False),
-            keras.layers.Dropout(0.2),
-            keras.layers.Dense(16, activation='relu'),
-            keras.layers.Dense(1)
+            keras.layers.LSTM(64, return_sequences=True, input_shape=input_shape, dtype=dtype_policy),
+            keras.layers.Dropout(0.2, dtype=dtype_policy),
+            keras.layers.LSTM(32, return_sequences=False, dtype=dtype_policy),
+            keras.layers.Dropout(0.2, dtype=dtype_policy),
+            keras.layers.Dense(16, activation='relu', dtype=dtype_policy),
+            keras.layers.Dense(1, dtype='float32')
         ])
         
         model.compile(
             optimizer='adam',
             loss='mse',
-            metrics=['mae']
+            metrics=['mae'],
+            jit_compile=True
         )
         
         return model
@@ -50,45 +331,27 @@ class FinancePredictorModel:
         if not transactions or len(transactions) < 5:
             return None, None
         
-        # Convertir a DataFrame
-        df = pd.DataFrame(transactions)
-        df['date'] = pd.to_datetime(df['date'])
-        df = df.sort_values('date')
-        
-        # Crear features temporales
-        df['day_of_week'] = df['date'].dt.dayofweek
-        df['day_of_month'] = df['date'].dt.day
-        df['month'] = df['date'].dt.month
-        df['is_weekend'] = df['day_of_week'].isin([5, 6]).astype(int)
-        
-        # Categorías one-hot encoding
-        category_dummies = pd.get_dummies(df['category'], prefix='cat')
-        df = pd.concat([df, category_dummies], axis=1)
-        
-        # Agregar por día
-        daily_data = df.groupby(df['date'].dt.date).agg({
-            'amount': ['sum', 'count', 'mean'],
-        }).reset_index()
-        
-        daily_data.columns = ['date', 'total_amount', 'transaction_count', 'avg_amount']
-        
-        return df, daily_data
+        return _prepare_data(transactions_key(transactions))
     
     def create_sequences(self, data, sequence_length=7):
         """Crear secuencias para LSTM"""
-        sequences = []
-        targets = []
+        if len(data) <= sequence_length:
+            return np.empty((0, sequence_length, data.shape[1])), np.empty((0, data.shape[1]))
         
-        for i in range(len(data) - sequence_length):
-            seq = data[i:i+sequence_length]
-            target = data[i+sequence_length]
-            sequences.append(seq)
-            targets.append(target)
+        # Ventanas deslizantes como vista, sin copiar por fila
+        windows = np.lib.stride_tricks.sliding_window_view(
+            data, (sequence_length, data.shape[1])
+        )[:, 0]
         
-        return np.array(sequences), np.array(targets)
+        return np.ascontiguousarray(windows[:-1]), np.ascontiguousarray(data[sequence_length:])
     
     def train_model(self, transactions, epochs=50):
         """Entrenar modelo con datos históricos"""
+        with self._train_lock:
+            return self._train(transactions, epochs)
+    
+    def _train(self, transactions, epochs=50):
+        """Entrenar y publicar un nuevo ModelState (requiere _train_lock)"""
         df, daily_data = self.prepare_data(transactions)
         
         if daily_data is None or len(daily_data) < 14:
@@ -96,7 +359,9 @@ class FinancePredictorModel:
         
         # Preparar datos para entrenamiento
         features = daily_data[['total_amount', 'transaction_count', 'avg_amount']].values
-        features_scaled = self.scaler.fit_transform(features)
+        scaler = _standard_scaler()().fit(features)
+        state = ModelState(None, scaler.mean_, scaler.scale_)
+        features_scaled = state.transform(features)
         
         # Crear secuencias
         X, y = self.create_sequences(features_scaled, sequence_length=7)
@@ -110,9 +375,8 @@ class FinancePredictorModel:
         y_train, y_test = y[:split], y[split:]
         
         # Construir y entrenar modelo
-        self.model = self.build_model((X_train.shape[1], X_train.shape[2]))
-        
-        history = self.model.fit(
+        model = self.build_model((X_train.shape[1], X_train.shape[2]), DTYPE_POLICY)
+        model.fit(
             X_train, y_train,
             validation_data=(X_test, y_test),
             epochs=epochs,
@@ -120,29 +384,102 @@ class FinancePredictorModel:
             verbose=0
         )
         
-        self.is_trained = True
+        state.model = model
         
         # Guardar modelo
         os.makedirs('models', exist_ok=True)
-        self.model.save(MODEL_PATH)
-        with open(SCALER_PATH, 'wb') as f:
-            pickle.dump(self.scaler, f)
+        model.save(MODEL_PATH)
+        np.save(WEIGHTS_PATH, np.concatenate([
+            w.ravel() for w in model.get_weights()
+        ]).astype(np.float32))
+        np.savez(SCALER_PATH, mean=state.mean, scale=state.scale)
         
+        # Convertir a TFLite para servir predicciones, un modelo por tamaño de lote
+        try:
+            interpreters = {}
+            for batch_size in BATCH_BUCKETS:
+                tflite_model = self._convert_to_tflite(model, batch_size)
+                with open(TFLITE_PATH.format(batch=batch_size), 'wb') as f:
+                    f.write(tflite_model)
+                interpreters[batch_size] = self._load_interpreters(model_content=tflite_model)
+            state.interpreters = interpreters
+        except Exception as e:
+            print(f"Error convirtiendo a TFLite: {e}")
+            for batch_size in BATCH_BUCKETS:
+                if os.path.exists(TFLITE_PATH.format(batch=batch_size)):
+                    os.remove(TFLITE_PATH.format(batch=batch_size))
+        
+        # Publicar modelo, escalado e intérpretes en una sola asignación
+        self.state = state
         return True
     
+    def _convert_to_tflite(self, model, batch_size):
+        """Convertir el modelo a TFLite con pesos en float16 y lote fijo"""
+        tf = _tf()
+        
+        # Lote fijo: los estados del LSTM se dimensionan al convertir,
+        # así que el intérprete no se redimensiona; los lotes se rellenan
+        serve = tf.function(lambda x: model(x, training=False))
+        concrete = serve.get_concrete_function(
+            tf.TensorSpec([batch_size, 7, 3], tf.float32)
+        )
+        converter = tf.lite.TFLiteConverter.from_concrete_functions([concrete], model)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS]
+        return converter.convert()
+    
+    def _load_interpreters(self, **kwargs):
+        """Crear un pool de intérpretes TFLite, uno por petición concurrente"""
+        tf = _tf()
+        pool = Queue()
+        for _ in range(INTERPRETER_POOL_SIZE):
+            interpreter = tf.lite.Interpreter(**kwargs)
+            interpreter.allocate_tensors()
+            pool.put(interpreter)
+        return pool
+    
     def load_model(self):
         """Cargar modelo pre-entrenado"""
         try:
-            if os.path.exists(MODEL_PATH) and os.path.exists(SCALER_PATH):
-                self.model = keras.models.load_model(MODEL_PATH)
-                with open(SCALER_PATH, 'rb') as f:
-                    self.scaler = pickle.load(f)
-                self.is_trained = True
+            has_model = os.path.exists(WEIGHTS_PATH) or os.path.exists(MODEL_PATH)
+            if has_model and os.path.exists(SCALER_PATH):
+                with self._train_lock:
+                    if os.path.exists(WEIGHTS_PATH):
+                        model = self._load_weights()
+                    else:
+                        model = _tf().keras.models.load_model(MODEL_PATH)
+                    with np.load(SCALER_PATH) as scaler:
+                        state = ModelState(model, scaler['mean'], scaler['scale'])
+                    tflite_paths = {b: TFLITE_PATH.format(batch=b) for b in BATCH_BUCKETS}
+                    if all(os.path.exists(path) for path in tflite_paths.values()):
+                        state.interpreters = {
+                            b: self._load_interpreters(model_path=path)
+                            for b, path in tflite_paths.items()
+                        }
+                    self.state = state
                 return True
         except Exception as e:
             print(f"Error cargando modelo: {e}")
         return False
     
+    def _load_weights(self):
+        """Reconstruir la arquitectura y cargar los pesos desde el memmap float32"""
+        model = self.build_model((7, 3), DTYPE_POLICY)
+        flat = np.load(WEIGHTS_PATH, mmap_mode='r')
+        
+        weights = []
+        offset = 0
+        for w in model.get_weights():
+            weights.append(flat[offset:offset + w.size].reshape(w.shape))
+            offset += w.size
+        
+        if offset != flat.size:
+            raise ValueError(f"{WEIGHTS_PATH} no coincide con la arquitectura del modelo")
+        
+        model.set_weights(weights)
+        return model
+    
     def predict_next_days(self, transactions, days=30):
         """Predecir gastos para los próximos N días"""
         df, daily_data = self.prepare_data(transactions)
@@ -151,55 +488,99 @@ class FinancePredictorModel:
             # Fallback a predicción simple
             return self._simple_prediction(transactions, days)
         
-        # Entrenar si no está entrenado
-        if not self.is_trained:
-            success = self.train_model(transactions)
-            if not success:
-                return self._simple_prediction(transactions, days)
+        # Entrenar si no está entrenado (una sola petición entrena; el resto espera)
+        state = self.state
+        if state is None:
+            with self._train_lock:
+                if self.state is None and not self._train(transactions):
+                    return self._simple_prediction(transactions, days)
+            state = self.state
         
         # Preparar últimos datos
         features = daily_data[['total_amount', 'transaction_count', 'avg_amount']].values
-        features_scaled = self.scaler.transform(features)
+        features_scaled = state.transform(features)
         
         # Usar últimos 7 días para predecir
         last_sequence = features_scaled[-7:].reshape(1, 7, 3)
         
-        predictions = []
-        current_sequence = last_sequence.copy()
-        
-        for _ in range(days):
-            pred = self.model.predict(current_sequence, verbose=0)
-            predictions.append(pred[0])
-            
-            # Actualizar secuencia
-            current_sequence = np.roll(current_sequence, -1, axis=1)
-            current_sequence[0, -1, :] = pred[0]
+        predictions = self.batcher.submit(state, last_sequence, int(days))
         
         # Desnormalizar predicciones
-        predictions = np.array(predictions)
-        predictions_denorm = self.scaler.inverse_transform(predictions)
+        predictions_denorm = state.inverse(predictions)
         
         return {
             'daily_predictions': predictions_denorm[:, 0].tolist(),
             'total_predicted': float(np.sum(predictions_denorm[:, 0]))
         }
     
+    def _rollout_batch(self, state, sequences, days):
+        """Rollout de un lote de secuencias; devuelve (días, lote, features)"""
+        if state.interpreters is not None:
+            try:
+                return self._rollout_tflite(state.interpreters, sequences, days)
+            except Exception as e:
+                print(f"Error en rollout TFLite, usando el grafo: {e}")
+        
+        # XLA compila una vez por forma: lote en BATCH_BUCKETS y horizonte
+        # redondeado a múltiplos de DAYS_BUCKET acotan las compilaciones
+        tf = _tf()
+        rollout_days = -(-days // DAYS_BUCKET) * DAYS_BUCKET
+        predictions = _compiled_rollout()(
+            state.model,
+            tf.constant(_pad_batch(sequences, _batch_bucket(len(sequences)))),
+            rollout_days
+        ).numpy()
+        
+        return predictions[:days, :len(sequences)]
+    
+    def _rollout_tflite(self, interpreters, sequences, days):
+        """Predicción autoregresiva con un intérprete TFLite del lote más ajustado"""
+        batch_size = _batch_bucket(len(sequences))
+        pool = interpreters[batch_size]
+        interpreter = pool.get()
+        try:
+            input_index = interpreter.get_input_details()[0]['index']
+            output_index = interpreter.get_output_details()[0]['index']
+            
+            # Cada modelo convertido espera exactamente batch_size secuencias
+            current_sequence = _pad_batch(sequences, batch_size)
+            
+            predictions = np.empty(
+                (days, current_sequence.shape[0], current_sequence.shape[2]),
+                dtype=np.float32
+            )
+            
+            for day in range(days):
+                interpreter.set_tensor(input_index, current_sequence)
+                interpreter.invoke()
+                pred = interpreter.get_tensor(output_index)
+                
+                # Actualizar secuencias en el mismo buffer
+                current_sequence[:, :-1, :] = current_sequence[:, 1:, :]
+                current_sequence[:, -1, :] = pred
+                predictions[day] = current_sequence[:, -1]
+        finally:
+            pool.put(interpreter)
+        
+        return predictions[:, :len(sequences)]
+    
     def _simple_prediction(self, transactions, days):
         """Predicción simple basada en promedios"""
-        df = pd.DataFrame(transactions)
-        expenses = df[df['type'] == 'expense']
+        amounts, types, _ = _column_arrays(transactions_key(transactions))
+        is_expense = types == 'expense'
         
-        if len(expenses) == 0:
+        if not is_expense.any():
             return {'daily_predictions': [0] * days, 'total_predicted': 0}
         
-        daily_avg = abs(expenses['amount'].mean())
+        daily_avg = _compiled_mean_abs_expense()(amounts, is_expense)
         
         return {
             'daily_predictions': [daily_avg] * days,
             'total_predicted': float(daily_avg * days)
         }
 
-# Instancia global del modelo
+# Instancia global del modelo. Se carga en cada worker (ver
+# gunicorn_conf.post_worker_init): TensorFlow no sobrevive a un fork
 predictor = FinancePredictorModel()
 
 @app.route('/health', methods=['GET'])
@@ -222,48 +603,36 @@ def predict():
         if not transactions:
             return jsonify({'error': 'No transactions provided'}), 400
         
+        if isinstance(days, bool) or not isinstance(days, int) or not 1 <= days <= MAX_PREDICTION_DAYS:
+            return jsonify({'error': f'days must be an integer between 1 and {MAX_PREDICTION_DAYS}'}), 400
+        
         # Realizar predicción
         predictions = predictor.predict_next_days(transactions, days)
         
         # Calcular métricas adicionales
-        df = pd.DataFrame(transactions)
-        expenses = df[df['type'] == 'expense']
-        income = df[df['type'] == 'income']
-        
-        total_expenses_historical = abs(expenses['amount'].sum()) if len(expenses) > 0 else 0
-        total_income_historical = income['amount'].sum() if len(income) > 0 else 0
-        current_balance = total_income_historical - total_expenses_historical
-        
-        # Calcular nivel de riesgo
+        total_expenses_historical, total_income_historical = _historical_totals(
+            transactions_key(transactions)
+        )
         predicted_expenses = predictions['total_predicted']
-        expense_ratio = predicted_expenses / total_income_historical if total_income_historical > 0 else 1
-        
-        if expense_ratio > 0.9:
-            risk_level = 'alto'
-        elif expense_ratio > 0.7:
-            risk_level = 'medio'
-        else:
-            risk_level = 'bajo'
-        
-        # Balance proyectado
-        avg_monthly_income = total_income_historical / max(1, len(transactions) // 30)
-        predicted_balance = current_balance + avg_monthly_income - predicted_expenses
-        
-        # Meta de ahorro sugerida
-        savings_goal = max(500, avg_monthly_income * 0.2)
+        summary = _financial_summary(
+            total_expenses_historical,
+            total_income_historical,
+            predicted_expenses,
+            len(transactions)
+        )
         
         response = {
             'predictions': predictions,
             'predictedMonthlyExpense': float(predicted_expenses),
-            'predictedBalance': float(predicted_balance),
-            'currentBalance': float(current_balance),
-            'riskLevel': risk_level,
-            'savingsGoal': float(savings_goal),
+            'predictedBalance': float(summary['predicted_balance']),
+            'currentBalance': float(summary['current_balance']),
+            'riskLevel': summary['risk_level'],
+            'savingsGoal': float(summary['savings_goal']),
             'statistics': {
                 'totalExpensesHistorical': float(total_expenses_historical),
                 'totalIncomeHistorical': float(total_income_historical),
-                'averageMonthlyIncome': float(avg_monthly_income),
-                'expenseRatio': float(expense_ratio)
+                'averageMonthlyIncome': float(summary['avg_monthly_income']),
+                'expenseRatio': float(summary['expense_ratio'])
             },
             'model_info': {
                 'trained': predictor.is_trained,
@@ -310,34 +679,38 @@ def category_insights():
         data = request.json
         transactions = data.get('transactions', [])
         
-        df = pd.DataFrame(transactions)
-        expenses = df[df['type'] == 'expense']
+        amounts, types, category_column = _column_arrays(transactions_key(transactions))
+        is_expense = types == 'expense'
         
-        if len(expenses) == 0:
+        if not is_expense.any():
             return jsonify({'insights': []})
         
         # Análisis por categoría
-        category_stats = expenses.groupby('category').agg({
-            'amount': ['sum', 'count', 'mean']
-        }).reset_index()
-        
-        category_stats.columns = ['category', 'total', 'count', 'average']
-        category_stats['total'] = abs(category_stats['total'])
-        category_stats['average'] = abs(category_stats['average'])
-        category_stats = category_stats.sort_values('total', ascending=False)
-        
-        insights = []
-        total_expenses = category_stats['total'].sum()
-        
-        for _, row in category_stats.iterrows():
-            percentage = (row['total'] / total_expenses * 100) if total_expenses > 0 else 0
-            insights.append({
-                'category': row['category'],
-                'total': float(row['total']),
-                'count': int(row['count']),
-                'average': float(row['average']),
-                'percentage': float(percentage)
-            })
+        codes, categories = _pd().factorize(category_column[is_expense])
+        amounts = amounts[is_expense]
+        
+        # Igual que groupby, se descartan las categorías nulas
+        valid = codes >= 0
+        codes, amounts = codes[valid], amounts[valid]
+        
+        # Como sum/count de pandas, los montos nulos no suman ni cuentan
+        has_amount = ~np.isnan(amounts)
+        totals = np.abs(np.bincount(
+            codes, weights=np.where(has_amount, amounts, 0.0), minlength=len(categories)
+        ))
+        counts = np.bincount(codes[has_amount], minlength=len(categories))
+        averages = totals / np.maximum(counts, 1)
+        
+        order = np.argsort(-totals, kind='stable')
+        total_expenses = totals.sum()
+        
+        insights = [{
+            'category': categories[i],
+            'total': float(totals[i]),
+            'count': int(counts[i]),
+            'average': float(averages[i]),
+            'percentage': float(totals[i] / total_expenses * 100) if total_expenses > 0 else 0.0
+        } for i in order]
         
         return jsonify({'insights': insights})
     
@@ -345,11 +718,12 @@ def category_insights():
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
-    # Intentar cargar modelo existente
+    # Intentar cargar modelo existente y compilar el fallback
     predictor.load_model()
+    _compiled_mean_abs_expense()
     
     print("🐍 Servicio Python ML iniciado")
     print(f"🤖 Modelo cargado: {predictor.is_trained}")
-    print("📊 TensorFlow version:", tf.__version__)
+    print("📊 TensorFlow version:", _tf().__version__)
     
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host='0.0.0.0', port=5000)
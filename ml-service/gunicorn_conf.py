@@ -0,0 +1,27 @@
+"""
+Configuración de gunicorn para el servicio ML
+"""
+
+import os
+
+# Importar la app en el proceso padre es barato (TensorFlow se importa
+# bajo demanda); el modelo se carga en cada worker tras el fork, porque
+# el runtime de TensorFlow y sus hilos no sobreviven a un fork
+preload_app = True
+
+# Cada worker carga su propia copia de TensorFlow (cientos de MB) y
+# os.cpu_count() ve las CPUs del host, no la cuota del contenedor:
+# un solo worker salvo que WEB_CONCURRENCY diga lo contrario
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+threads = 4
+worker_class = 'gthread'
+
+# Un intérprete TFLite por hilo de cada worker
+os.environ.setdefault('INTERPRETER_POOL_SIZE', str(threads))
+
+
+def post_worker_init(worker):
+    """Cargar el modelo guardado y compilar el fallback en el worker recién creado"""
+    from app import predictor, _compiled_mean_abs_expense
+    predictor.load_model()
+    _compiled_mean_abs_expense()
@@ -0,0 +1,117 @@
+"""
+Pruebas del micro-batching de rollouts con un run_batch de prueba
+"""
+
+import threading
+import unittest
+
+import numpy as np
+
+from app import RolloutBatcher, _batch_bucket, BATCH_MAX_SIZE
+
+
+def _sequence(value):
+    """Secuencia (1, 7, 3) cuyo valor identifica a la petición"""
+    return np.full((1, 7, 3), value, dtype=np.float32)
+
+
+class StubRunBatch:
+    """run_batch que registra cada llamada y repite la última fila de cada secuencia"""
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.calls = []
+        self._lock = threading.Lock()
+    
+    def __call__(self, state, sequences, days):
+        with self._lock:
+            self.calls.append((state, len(sequences), days))
+        if self.fail_on is not None and (sequences == self.fail_on).any():
+            raise ValueError('secuencia inválida')
+        return np.repeat(sequences[None, :, -1, :], days, axis=0)
+
+
+def submit_concurrently(batcher, requests):
+    """Enviar (state, valor, días) en paralelo; devuelve resultados o excepciones"""
+    results = [None] * len(requests)
+    start = threading.Barrier(len(requests))
+    
+    def worker(i, state, value, days):
+        start.wait()
+        try:
+            results[i] = batcher.submit(state, _sequence(value), days)
+        except Exception as e:
+            results[i] = e
+    
+    threads = [
+        threading.Thread(target=worker, args=(i,) + request)
+        for i, request in enumerate(requests)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    
+    return results
+
+
+class RolloutBatcherTest(unittest.TestCase):
+    def test_single_request(self):
+        run_batch = StubRunBatch()
+        batcher = RolloutBatcher(run_batch, max_wait=0.001)
+        
+        result = batcher.submit('modelo', _sequence(1.0), 5)
+        
+        self.assertEqual(result.shape, (5, 3))
+        np.testing.assert_array_equal(result, 1.0)
+        self.assertEqual(run_batch.calls, [('modelo', 1, 5)])
+    
+    def test_concurrent_requests_share_one_call(self):
+        run_batch = StubRunBatch()
+        batcher = RolloutBatcher(run_batch, max_wait=0.5)
+        
+        results = submit_concurrently(batcher, [('modelo', float(i), 10) for i in range(4)])
+        
+        self.assertEqual(run_batch.calls, [('modelo', 4, 10)])
+        for i, result in enumerate(results):
+            np.testing.assert_array_equal(result, float(i))
+    
+    def test_groups_by_state_and_days(self):
+        run_batch = StubRunBatch()
+        batcher = RolloutBatcher(run_batch, workers=2, max_wait=0.5)
+        
+        results = submit_concurrently(batcher, [
+            ('a', 1.0, 10), ('a', 2.0, 10), ('a', 3.0, 20), ('b', 4.0, 10)
+        ])
+        
+        self.assertCountEqual(run_batch.calls, [('a', 2, 10), ('a', 1, 20), ('b', 1, 10)])
+        self.assertEqual([len(r) for r in results], [10, 10, 20, 10])
+        for i, result in enumerate(results):
+            np.testing.assert_array_equal(result, float(i + 1))
+    
+    def test_failure_does_not_fail_the_batch(self):
+        run_batch = StubRunBatch(fail_on=-1.0)
+        batcher = RolloutBatcher(run_batch, max_wait=0.5)
+        
+        results = submit_concurrently(batcher, [
+            ('modelo', 1.0, 3), ('modelo', -1.0, 3), ('modelo', 2.0, 3)
+        ])
+        
+        self.assertIsInstance(results[1], ValueError)
+        np.testing.assert_array_equal(results[0], 1.0)
+        np.testing.assert_array_equal(results[2], 2.0)
+        # Un intento con el lote completo y luego uno por petición
+        self.assertEqual(run_batch.calls[0], ('modelo', 3, 3))
+        self.assertEqual(len(run_batch.calls), 4)
+
+
+class BatchBucketTest(unittest.TestCase):
+    def test_smallest_bucket_that_fits(self):
+        self.assertEqual(_batch_bucket(1), 1)
+        self.assertEqual(_batch_bucket(2), 8)
+        self.assertEqual(_batch_bucket(8), 8)
+        self.assertEqual(_batch_bucket(9), BATCH_MAX_SIZE)
+        self.assertEqual(_batch_bucket(BATCH_MAX_SIZE), BATCH_MAX_SIZE)
+
+
+if __name__ == '__main__':
+    unittest.main()